@@ -5,16 +5,108 @@ This script demonstrates common AWS operations using boto3
 """
 
 import boto3
+import inspect
 import json
 import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime
-from typing import Dict, List, Optional
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterator, List, Optional
 import logging
+from botocore.config import Config
+from boto3.exceptions import S3UploadFailedError
+from botocore.exceptions import BotoCoreError, ClientError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Extracts (Key, Value) pairs from AWS tag lists so dict() can build tag maps in C
+_tag_pair = itemgetter('Key', 'Value')
+
+# Stack statuses returned by list_cloudformation_stacks unless overridden; deleted
+# and in-progress stacks are excluded by CloudFormation rather than client-side
+DEFAULT_STACK_STATUSES = ['CREATE_COMPLETE', 'UPDATE_COMPLETE']
+
+# Upper bound on concurrent per-bucket S3 lookups (boto3 clients are thread-safe)
+S3_LOOKUP_WORKERS = 64
+
+# Shared by every client. The connection pool is sized to the lookup concurrency
+# so parallel calls don't queue for a socket, keep-alive avoids repeated TLS
+# handshakes, and adaptive retries add client-side token-bucket rate limiting on
+# top of exponential backoff when AWS starts throttling.
+CLIENT_CONFIG = Config(
+    max_pool_connections=S3_LOOKUP_WORKERS,
+    retries={'mode': 'adaptive', 'max_attempts': 10},
+    tcp_keepalive=True,
+    connect_timeout=5,
+    read_timeout=30
+)
+
+
+@dataclass(slots=True)
+class EC2Instance:
+    """EC2 instance summary returned by list_ec2_instances"""
+    instance_id: str
+    instance_type: str
+    state: str
+    public_ip: str
+    private_ip: str
+    launch_time: datetime
+    tags: Dict[str, str]
+
+
+@dataclass(slots=True)
+class S3Bucket:
+    """S3 bucket summary returned by list_s3_buckets"""
+    name: str
+    creation_date: datetime
+    region: Optional[str]
+
+
+@dataclass(slots=True)
+class CloudFormationStack:
+    """CloudFormation stack summary returned by list_cloudformation_stacks"""
+    stack_name: str
+    stack_status: str
+    creation_time: datetime
+    description: str
+
+
+@dataclass(slots=True)
+class VPC:
+    """VPC summary returned by get_vpc_info"""
+    vpc_id: str
+    cidr_block: str
+    state: str
+    is_default: bool
+    tags: Dict[str, str]
+
+
+def _paginate(fn: Callable, token_key_in: str = 'NextToken', token_key_out: str = 'NextToken',
+              max_results: Optional[int] = 1000, **kwargs) -> Iterator[Dict]:
+    """
+    Yield every page of a boto3 list/describe call by following its continuation token
+    
+    Args:
+        fn: Bound client method, e.g. ec2.describe_instances
+        token_key_in: Request parameter that carries the continuation token
+        token_key_out: Response key that holds the next continuation token
+        max_results: Page size to request, or None for APIs without MaxResults
+        **kwargs: Extra arguments passed to every call
+    """
+    if max_results is not None:
+        kwargs['MaxResults'] = max_results
+    
+    response = fn(**kwargs)
+    yield response
+    
+    # Stop on a missing, empty or null token, as botocore's own paginators do
+    while response.get(token_key_out):
+        response = fn(**kwargs, **{token_key_in: response[token_key_out]})
+        yield response
+
 
 class AWSInfrastructureManager:
     """AWS Infrastructure Management class using boto3"""
@@ -31,16 +123,88 @@ class AWSInfrastructureManager:
         self.session = boto3.Session(profile_name=profile) if profile else boto3.Session()
         
         # Initialize AWS clients
-        self.ec2 = self.session.client('ec2', region_name=region)
-        self.s3 = self.session.client('s3', region_name=region)
-        self.iam = self.session.client('iam', region_name=region)
-        self.cloudformation = self.session.client('cloudformation', region_name=region)
-        self.sts = self.session.client('sts', region_name=region)
+        self.ec2 = self.session.client('ec2', region_name=region, config=CLIENT_CONFIG)
+        self.s3 = self.session.client('s3', region_name=region, config=CLIENT_CONFIG)
+        self.iam = self.session.client('iam', region_name=region, config=CLIENT_CONFIG)
+        self.cloudformation = self.session.client('cloudformation', region_name=region, config=CLIENT_CONFIG)
+        self.sts = self.session.client('sts', region_name=region, config=CLIENT_CONFIG)
+        
+        # Bucket name -> region; bucket regions never change once created
+        self._bucket_region_cache: Dict[str, str] = {}
+        
+        # STS caller identity, set on the first successful lookup
+        self._account_info: Optional[Dict] = None
         
         logger.info(f"Initialized AWS clients for region: {region}")
     
+    @classmethod
+    def _scan_one(cls, region: str, fn_name: str, profile: Optional[str] = None) -> Any:
+        """Run a single manager method against one region (executed in a worker process)"""
+        manager = cls(region=region, profile=profile)
+        return getattr(manager, fn_name)()
+    
+    @classmethod
+    def scan_all_regions(cls, regions: List[str], fn_name: str = 'list_ec2_instances',
+                         profile: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Run a manager method in several regions in parallel
+        
+        Each region is scanned in its own process with its own clients, so
+        response parsing is not serialized on the GIL.
+        
+        Args:
+            regions: AWS regions to scan
+            fn_name: Name of the no-argument method to call, e.g. 'get_vpc_info'
+            profile: AWS profile name (optional)
+        
+        Returns:
+            Mapping of region to that method's result
+        
+        Raises:
+            ValueError: If fn_name is not a method or is a generator (iter_*), whose
+                result cannot be sent back from the worker process
+        """
+        method = getattr(cls, fn_name, None)
+        if not callable(method):
+            raise ValueError(f"Unknown manager method: {fn_name}")
+        if inspect.isgeneratorfunction(method):
+            raise ValueError(f"{fn_name} is a generator; pass the method that returns a list instead")
+        
+        if not regions:
+            return {}
+        
+        with ProcessPoolExecutor(max_workers=len(regions)) as executor:
+            results = executor.map(
+                cls._scan_one, regions, [fn_name] * len(regions), [profile] * len(regions)
+            )
+            return dict(zip(regions, results))
+    
+    @property
+    def account_info(self) -> Dict:
+        """
+        AWS account information, fetched from STS once per manager
+        
+        Only a successful lookup is cached, and callers get a copy so the cached
+        value cannot be modified. Call invalidate_account_info() to re-fetch after
+        switching credentials.
+        """
+        if self._account_info is None:
+            account_info = self._fetch_account_info()
+            if not account_info:
+                return {}
+            self._account_info = account_info
+        return dict(self._account_info)
+    
+    def invalidate_account_info(self) -> None:
+        """Forget the cached account information"""
+        self._account_info = None
+    
     def get_account_info(self) -> Dict:
-        """Get AWS account information"""
+        """Get AWS account information (cached after the first successful call)"""
+        return self.account_info
+    
+    def _fetch_account_info(self) -> Dict:
+        """Fetch AWS account information from STS"""
         try:
             response = self.sts.get_caller_identity()
             return {
@@ -48,58 +212,105 @@ class AWSInfrastructureManager:
                 'user_id': response['UserId'],
                 'arn': response['Arn']
             }
-        except Exception as e:
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error getting account info: {e}")
             return {}
     
-    def list_ec2_instances(self) -> List[Dict]:
-        """List all EC2 instances"""
-        try:
-            response = self.ec2.describe_instances()
-            instances = []
-            
+    def iter_ec2_instances(self, states: Optional[List[str]] = None,
+                           filters: Optional[List[Dict]] = None) -> Iterator[EC2Instance]:
+        """
+        Yield EC2 instances page by page, filtered server-side
+        
+        AWS errors propagate to the caller, so a failure part way through is never
+        mistaken for the end of the inventory.
+        
+        Args:
+            states: Instance state names to include, e.g. ['running'] (optional)
+            filters: Additional DescribeInstances filters (optional)
+        """
+        aws_filters = list(filters or [])
+        if states:
+            aws_filters.append({'Name': 'instance-state-name', 'Values': states})
+        kwargs = {'Filters': aws_filters} if aws_filters else {}
+        
+        for response in _paginate(self.ec2.describe_instances, **kwargs):
             for reservation in response['Reservations']:
                 for instance in reservation['Instances']:
-                    instances.append({
-                        'instance_id': instance['InstanceId'],
-                        'instance_type': instance['InstanceType'],
-                        'state': instance['State']['Name'],
-                        'public_ip': instance.get('PublicIpAddress', 'N/A'),
-                        'private_ip': instance.get('PrivateIpAddress', 'N/A'),
-                        'launch_time': instance['LaunchTime'].strftime('%Y-%m-%d %H:%M:%S'),
-                        'tags': {tag['Key']: tag['Value'] for tag in instance.get('Tags', [])}
-                    })
-            
-            return instances
-        except Exception as e:
+                    yield EC2Instance(
+                        instance_id=instance['InstanceId'],
+                        instance_type=instance['InstanceType'],
+                        state=instance['State']['Name'],
+                        public_ip=instance.get('PublicIpAddress', 'N/A'),
+                        private_ip=instance.get('PrivateIpAddress', 'N/A'),
+                        launch_time=instance['LaunchTime'],
+                        tags=dict(map(_tag_pair, instance.get('Tags', ())))
+                    )
+    
+    def list_ec2_instances(self, states: Optional[List[str]] = None,
+                           filters: Optional[List[Dict]] = None) -> List[EC2Instance]:
+        """List EC2 instances, filtered server-side (see iter_ec2_instances)"""
+        try:
+            return list(self.iter_ec2_instances(states, filters))
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error listing EC2 instances: {e}")
             return []
     
-    def list_s3_buckets(self) -> List[Dict]:
-        """List all S3 buckets"""
+    def list_s3_buckets(self, include_region: bool = True) -> List[S3Bucket]:
+        """
+        List all S3 buckets
+        
+        Args:
+            include_region: Look up each bucket's region; when False, 'region' is None
+                and no per-bucket requests are made
+        """
         try:
             response = self.s3.list_buckets()
-            buckets = []
             
+            regions = {}
+            if include_region:
+                regions = self._get_bucket_regions([b['Name'] for b in response['Buckets']])
+            
+            buckets = []
             for bucket in response['Buckets']:
-                # Get bucket location
-                try:
-                    location_response = self.s3.get_bucket_location(Bucket=bucket['Name'])
-                    region = location_response.get('LocationConstraint', 'us-east-1')
-                except:
-                    region = 'unknown'
-                
-                buckets.append({
-                    'name': bucket['Name'],
-                    'creation_date': bucket['CreationDate'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'region': region
-                })
+                buckets.append(S3Bucket(
+                    name=bucket['Name'],
+                    creation_date=bucket['CreationDate'],
+                    region=regions.get(bucket['Name'])
+                ))
             
             return buckets
-        except Exception as e:
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error listing S3 buckets: {e}")
             return []
     
+    def _get_bucket_regions(self, bucket_names: List[str]) -> Dict[str, str]:
+        """Get the regions of several S3 buckets, looking up uncached ones concurrently"""
+        regions = {name: self._bucket_region_cache[name]
+                   for name in bucket_names if name in self._bucket_region_cache}
+        missing = [name for name in bucket_names if name not in regions]
+        
+        if missing:
+            # One round trip per bucket, so run them in parallel rather than in sequence
+            workers = min(S3_LOOKUP_WORKERS, len(missing))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                regions.update(zip(missing, executor.map(self._get_bucket_region, missing)))
+        
+        return regions
+    
+    def _get_bucket_region(self, bucket_name: str) -> str:
+        """Get the region of an S3 bucket, or 'unknown' if it cannot be read"""
+        try:
+            location_response = self.s3.get_bucket_location(Bucket=bucket_name)
+        except (ClientError, BotoCoreError):
+            # One unreadable bucket must not fail the whole listing
+            return 'unknown'
+        
+        # A bucket's region is fixed at creation, so it is safe to cache for the process lifetime
+        # us-east-1 buckets report an empty LocationConstraint, which botocore parses as None
+        region = location_response.get('LocationConstraint') or 'us-east-1'
+        self._bucket_region_cache[bucket_name] = region
+        return region
+    
     def create_s3_bucket(self, bucket_name: str, region: Optional[str] = None) -> bool:
         """Create an S3 bucket"""
         try:
@@ -116,7 +327,7 @@ class AWSInfrastructureManager:
             
             logger.info(f"Created S3 bucket: {bucket_name}")
             return True
-        except Exception as e:
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error creating S3 bucket {bucket_name}: {e}")
             return False
     
@@ -126,46 +337,59 @@ class AWSInfrastructureManager:
             self.s3.upload_file(file_path, bucket_name, key)
             logger.info(f"Uploaded {file_path} to s3://{bucket_name}/{key}")
             return True
-        except Exception as e:
+        except (ClientError, BotoCoreError, S3UploadFailedError, OSError) as e:
             logger.error(f"Error uploading file to S3: {e}")
             return False
     
-    def list_cloudformation_stacks(self) -> List[Dict]:
-        """List CloudFormation stacks"""
-        try:
-            response = self.cloudformation.list_stacks(StackStatusFilter=['CREATE_COMPLETE', 'UPDATE_COMPLETE'])
-            stacks = []
-            
+    def iter_cloudformation_stacks(self, statuses: Optional[List[str]] = None) -> Iterator[CloudFormationStack]:
+        """
+        Yield CloudFormation stacks page by page, filtered server-side by status
+        
+        AWS errors propagate to the caller.
+        
+        Args:
+            statuses: Stack statuses to include (defaults to DEFAULT_STACK_STATUSES)
+        """
+        pages = _paginate(
+            self.cloudformation.list_stacks,
+            max_results=None,
+            StackStatusFilter=statuses or DEFAULT_STACK_STATUSES
+        )
+        
+        for response in pages:
             for stack in response['StackSummaries']:
-                stacks.append({
-                    'stack_name': stack['StackName'],
-                    'stack_status': stack['StackStatus'],
-                    'creation_time': stack['CreationTime'].strftime('%Y-%m-%d %H:%M:%S'),
-                    'description': stack.get('StackStatusReason', 'N/A')
-                })
-            
-            return stacks
-        except Exception as e:
+                yield CloudFormationStack(
+                    stack_name=stack['StackName'],
+                    stack_status=stack['StackStatus'],
+                    creation_time=stack['CreationTime'],
+                    description=stack.get('StackStatusReason', 'N/A')
+                )
+    
+    def list_cloudformation_stacks(self, statuses: Optional[List[str]] = None) -> List[CloudFormationStack]:
+        """List CloudFormation stacks, filtered server-side by status (see iter_cloudformation_stacks)"""
+        try:
+            return list(self.iter_cloudformation_stacks(statuses))
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error listing CloudFormation stacks: {e}")
             return []
     
-    def get_vpc_info(self) -> List[Dict]:
-        """Get VPC information"""
-        try:
-            response = self.ec2.describe_vpcs()
-            vpcs = []
-            
+    def iter_vpcs(self) -> Iterator[VPC]:
+        """Yield VPCs page by page; AWS errors propagate to the caller"""
+        for response in _paginate(self.ec2.describe_vpcs):
             for vpc in response['Vpcs']:
-                vpcs.append({
-                    'vpc_id': vpc['VpcId'],
-                    'cidr_block': vpc['CidrBlock'],
-                    'state': vpc['State'],
-                    'is_default': vpc['IsDefault'],
-                    'tags': {tag['Key']: tag['Value'] for tag in vpc.get('Tags', [])}
-                })
-            
-            return vpcs
-        except Exception as e:
+                yield VPC(
+                    vpc_id=vpc['VpcId'],
+                    cidr_block=vpc['CidrBlock'],
+                    state=vpc['State'],
+                    is_default=vpc['IsDefault'],
+                    tags=dict(map(_tag_pair, vpc.get('Tags', ())))
+                )
+    
+    def get_vpc_info(self) -> List[VPC]:
+        """Get VPC information (see iter_vpcs)"""
+        try:
+            return list(self.iter_vpcs())
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error getting VPC info: {e}")
             return []
     
@@ -181,7 +405,7 @@ class AWSInfrastructureManager:
             security_group_id = response['GroupId']
             logger.info(f"Created security group: {security_group_id}")
             return security_group_id
-        except Exception as e:
+        except (ClientError, BotoCoreError) as e:
             logger.error(f"Error creating security group: {e}")
             return None
 
@@ -194,49 +418,63 @@ def main():
     # Initialize AWS manager
     aws_manager = AWSInfrastructureManager()
     
-    # Get account information
-    print("\n1. Account Information:")
-    account_info = aws_manager.get_account_info()
-    if account_info:
-        print(f"   Account ID: {account_info['account_id']}")
-        print(f"   User ID: {account_info['user_id']}")
-        print(f"   ARN: {account_info['arn']}")
-    
-    # List EC2 instances
-    print("\n2. EC2 Instances:")
-    instances = aws_manager.list_ec2_instances()
-    if instances:
-        for instance in instances:
-            print(f"   {instance['instance_id']} ({instance['instance_type']}) - {instance['state']}")
-            print(f"     Public IP: {instance['public_ip']}, Private IP: {instance['private_ip']}")
-    else:
-        print("   No EC2 instances found")
+    # The calls are independent, so fetch the later sections in the background
+    # while the EC2 instances are streamed as each page arrives
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        account_future = executor.submit(aws_manager.get_account_info)
+        buckets_future = executor.submit(aws_manager.list_s3_buckets)
+        stacks_future = executor.submit(aws_manager.list_cloudformation_stacks)
+        vpcs_future = executor.submit(aws_manager.get_vpc_info)
+        
+        # Get account information
+        print("\n1. Account Information:")
+        account_info = account_future.result()
+        if account_info:
+            print(f"   Account ID: {account_info['account_id']}")
+            print(f"   User ID: {account_info['user_id']}")
+            print(f"   ARN: {account_info['arn']}")
+        
+        # List EC2 instances
+        print("\n2. EC2 Instances:")
+        found = False
+        try:
+            for instance in aws_manager.iter_ec2_instances():
+                found = True
+                print(f"   {instance.instance_id} ({instance.instance_type}) - {instance.state}")
+                print(f"     Public IP: {instance.public_ip}, Private IP: {instance.private_ip}")
+        except (ClientError, BotoCoreError) as e:
+            logger.error(f"Error listing EC2 instances: {e}")
+            print("   EC2 instance listing incomplete (see error above)")
+        else:
+            if not found:
+                print("   No EC2 instances found")
+        
+        buckets = buckets_future.result()
+        stacks = stacks_future.result()
+        vpcs = vpcs_future.result()
     
     # List S3 buckets
     print("\n3. S3 Buckets:")
-    buckets = aws_manager.list_s3_buckets()
     if buckets:
         for bucket in buckets:
-            print(f"   {bucket['name']} (Region: {bucket['region']})")
+            print(f"   {bucket.name} (Region: {bucket.region})")
     else:
         print("   No S3 buckets found")
     
     # List CloudFormation stacks
     print("\n4. CloudFormation Stacks:")
-    stacks = aws_manager.list_cloudformation_stacks()
     if stacks:
         for stack in stacks:
-            print(f"   {stack['stack_name']} - {stack['stack_status']}")
+            print(f"   {stack.stack_name} - {stack.stack_status}")
     else:
         print("   No CloudFormation stacks found")
     
     # Get VPC information
     print("\n5. VPCs:")
-    vpcs = aws_manager.get_vpc_info()
     if vpcs:
         for vpc in vpcs:
-            print(f"   {vpc['vpc_id']} ({vpc['cidr_block']}) - {vpc['state']}")
-            if vpc['is_default']:
+            print(f"   {vpc.vpc_id} ({vpc.cidr_block}) - {vpc.state}")
+            if vpc.is_default:
                 print("     [Default VPC]")
     else:
         print("   No VPCs found")
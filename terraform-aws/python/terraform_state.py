@@ -5,21 +5,66 @@ This script demonstrates how to interact with Terraform state stored in S3
 """
 
 import boto3
+import copy
+import ijson
 import json
-import tempfile
-import os
-from typing import Dict, List, Optional
+import orjson
+import re
+import time
+from contextlib import closing
+from dataclasses import dataclass
+from operator import itemgetter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 import logging
+from botocore.exceptions import BotoCoreError, ClientError
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Fields shared by every instance of a state resource
+_resource_fields = itemgetter('type', 'name', 'provider')
+
+# orjson silently parses integers outside the 64-bit range as floats. Such integers
+# have at least 19 digits, so documents containing a run that long go to json instead
+# (a run inside a string or a fraction only costs the slower parser, not accuracy).
+_LONG_DIGITS = re.compile(rb'\d{19,}')
+
+
+def _loads(data: bytes) -> Any:
+    """Parse JSON with orjson, falling back to json for what orjson cannot represent exactly"""
+    if _LONG_DIGITS.search(data):
+        return json.loads(data)
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        # orjson rejects NaN and Infinity, which json accepts
+        return json.loads(data)
+
+
+def _dumps(obj: Any) -> bytes:
+    """Serialize to indented JSON with orjson, falling back to json for integers beyond 64 bits"""
+    try:
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+    except orjson.JSONEncodeError:
+        return json.dumps(obj, indent=2).encode('utf-8')
+
+
+@dataclass(slots=True)
+class TerraformResource:
+    """One resource instance recorded in Terraform state"""
+    type: str
+    name: str
+    provider: str
+    state: Dict[str, Any]
+    dependencies: List[str]
+
 
 class TerraformStateManager:
     """Manage Terraform state stored in S3"""
     
-    def __init__(self, bucket_name: str, state_key: str, region: str = 'us-east-1'):
+    def __init__(self, bucket_name: str, state_key: str, region: str = 'us-east-1',
+                 cache_ttl: float = 300):
         """
         Initialize Terraform state manager
         
@@ -27,84 +72,167 @@ class TerraformStateManager:
             bucket_name: S3 bucket containing Terraform state
             state_key: S3 key for Terraform state file
             region: AWS region
+            cache_ttl: Seconds a downloaded state is reused before fetching it again
         """
         self.bucket_name = bucket_name
         self.state_key = state_key
         self.region = region
         
+        # (time.monotonic() of the download, parsed state) of the last successful
+        # download, and the ETag it was served with for conditional re-fetches once
+        # the TTL expires. The parsed state is never handed out directly.
+        self._cache: Optional[Tuple[float, Dict]] = None
+        self._ttl = cache_ttl
+        self._etag: Optional[str] = None
+        
         self.s3 = boto3.client('s3', region_name=region)
         logger.info(f"Initialized Terraform state manager for s3://{bucket_name}/{state_key}")
     
+    def _cached_state(self) -> Optional[Dict]:
+        """Return the cached state if it is still within the TTL"""
+        if self._cache and time.monotonic() - self._cache[0] < self._ttl:
+            return self._cache[1]
+        return None
+    
     def download_state(self) -> Optional[Dict]:
-        """Download Terraform state from S3"""
+        """
+        Download Terraform state from S3, reusing a recent download if available
+        
+        Once the cached copy is older than the TTL it is revalidated with an
+        If-None-Match request, so an unchanged state is neither transferred nor
+        parsed again. Callers get their own copy, so modifying it does not
+        affect later calls.
+        
+        The state is parsed with orjson, which only represents integers that fit
+        in 64 bits; states with longer integers, NaN or Infinity are parsed with
+        the json module instead so no value is changed.
+        """
+        state_data = self._load_state()
+        return copy.deepcopy(state_data) if state_data is not None else None
+    
+    def _load_state(self) -> Optional[Dict]:
+        """Return the cached state, downloading or revalidating it first if needed"""
+        state_data = self._cached_state()
+        if state_data is not None:
+            return state_data
+        
+        request = {'Bucket': self.bucket_name, 'Key': self.state_key}
+        if self._cache and self._etag:
+            request['IfNoneMatch'] = self._etag
+        
         try:
-            with tempfile.NamedTemporaryFile(mode='w+b', delete=False) as temp_file:
-                self.s3.download_fileobj(self.bucket_name, self.state_key, temp_file)
-                temp_file.seek(0)
-                state_data = json.load(temp_file)
-                os.unlink(temp_file.name)
-                
-                logger.info("Successfully downloaded Terraform state")
-                return state_data
-        except Exception as e:
+            response = self.s3.get_object(**request)
+            with response['Body'] as body:
+                state_data = _loads(body.read())
+            
+            self._cache = (time.monotonic(), state_data)
+            self._etag = response.get('ETag')
+            logger.info("Successfully downloaded Terraform state")
+            return state_data
+        except ClientError as e:
+            if self._cache and e.response['Error']['Code'] in ('304', 'NotModified'):
+                # Unchanged on S3 since the last download; restart the TTL on the cached copy
+                self._cache = (time.monotonic(), self._cache[1])
+                logger.info("Terraform state unchanged, using cached copy")
+                return self._cache[1]
+            
+            logger.error(f"Error downloading Terraform state: {e}")
+            return None
+        except (BotoCoreError, json.JSONDecodeError) as e:
             logger.error(f"Error downloading Terraform state: {e}")
             return None
     
     def upload_state(self, state_data: Dict) -> bool:
-        """Upload Terraform state to S3"""
+        """
+        Upload Terraform state to S3
+        
+        The state is serialized with orjson, which only accepts integers that fit
+        in 64 bits; a state with longer integers is serialized with the json module
+        instead.
+        """
         try:
-            with tempfile.NamedTemporaryFile(mode='w', delete=False) as temp_file:
-                json.dump(state_data, temp_file, indent=2)
-                temp_file.flush()
-                
-                self.s3.upload_file(temp_file.name, self.bucket_name, self.state_key)
-                os.unlink(temp_file.name)
-                
-                logger.info("Successfully uploaded Terraform state")
-                return True
-        except Exception as e:
+            body = _dumps(state_data)
+            self.s3.put_object(Bucket=self.bucket_name, Key=self.state_key, Body=body)
+            self._cache = None
+            self._etag = None
+            
+            logger.info("Successfully uploaded Terraform state")
+            return True
+        except (ClientError, BotoCoreError, TypeError, ValueError) as e:
             logger.error(f"Error uploading Terraform state: {e}")
             return False
     
-    def get_resources(self) -> List[Dict]:
-        """Get all resources from Terraform state"""
-        state_data = self.download_state()
-        if not state_data:
-            return []
+    @staticmethod
+    def _iter_instances(resources: Iterable[Dict]) -> Iterator[TerraformResource]:
+        """Flatten raw state resources into one record per resource instance"""
+        for resource in resources:
+            # Look up the per-resource fields once, not once per instance
+            r_type, r_name, r_provider = _resource_fields(resource)
+            dependencies = resource.get('depends_on', [])
+            for instance in resource.get('instances', ()):
+                yield TerraformResource(
+                    type=r_type,
+                    name=r_name,
+                    provider=r_provider,
+                    state=instance.get('attributes', {}),
+                    dependencies=dependencies
+                )
+    
+    def get_resources(self, stream: bool = False) -> Iterator[TerraformResource]:
+        """
+        Yield all resources from Terraform state
         
-        resources = []
-        for resource in state_data.get('resources', []):
-            for instance in resource.get('instances', []):
-                resources.append({
-                    'type': resource['type'],
-                    'name': resource['name'],
-                    'provider': resource['provider'],
-                    'state': instance.get('attributes', {}),
-                    'dependencies': resource.get('depends_on', [])
-                })
+        By default the state comes from download_state, so it is fetched and parsed
+        once and then shared with get_resource_by_type, get_resource_by_name and
+        list_outputs until the TTL expires (after which it is revalidated by ETag).
         
-        return resources
-    
-    def get_resource_by_type(self, resource_type: str) -> List[Dict]:
-        """Get resources filtered by type"""
-        all_resources = self.get_resources()
-        return [r for r in all_resources if r['type'] == resource_type]
-    
-    def get_resource_by_name(self, resource_name: str) -> Optional[Dict]:
-        """Get a specific resource by name"""
-        all_resources = self.get_resources()
-        for resource in all_resources:
-            if resource['name'] == resource_name:
-                return resource
-        return None
+        Args:
+            stream: Parse the state incrementally from the S3 response body instead,
+                holding one resource in memory at a time. Every streamed call makes
+                its own GET and nothing is cached, so only use it for states too
+                large to keep in memory.
+        
+        Raises:
+            ClientError, BotoCoreError, ijson.JSONError: When streaming, if the state
+                cannot be fetched or parsed, including part way through, so a failure
+                is never mistaken for the end of the state
+        """
+        if not stream:
+            state_data = self._load_state()
+            if state_data is not None:
+                # Copy one resource at a time so records never share the cached state
+                yield from self._iter_instances(map(copy.deepcopy, state_data.get('resources', [])))
+            return
+        
+        response = self.s3.get_object(Bucket=self.bucket_name, Key=self.state_key)
+        with response['Body'] as body:
+            yield from self._iter_instances(ijson.items(body, 'resources.item', use_float=True))
+    
+    def get_resource_by_type(self, resource_type: str, stream: bool = False) -> List[TerraformResource]:
+        """Get resources filtered by type (see get_resources for stream)"""
+        try:
+            return [r for r in self.get_resources(stream) if r.type == resource_type]
+        except (ClientError, BotoCoreError, ijson.JSONError) as e:
+            logger.error(f"Error reading resources from Terraform state: {e}")
+            return []
+    
+    def get_resource_by_name(self, resource_name: str, stream: bool = False) -> Optional[TerraformResource]:
+        """Get a specific resource by name, stopping at the first match (see get_resources for stream)"""
+        try:
+            # Close the generator on an early match so a streamed response body is released now
+            with closing(self.get_resources(stream)) as resources:
+                return next((r for r in resources if r.name == resource_name), None)
+        except (ClientError, BotoCoreError, ijson.JSONError) as e:
+            logger.error(f"Error reading resources from Terraform state: {e}")
+            return None
     
     def list_outputs(self) -> Dict:
         """Get Terraform outputs from state"""
-        state_data = self.download_state()
+        state_data = self._load_state()
         if not state_data:
             return {}
         
-        return state_data.get('outputs', {})
+        return copy.deepcopy(state_data.get('outputs', {}))
 
 
 def main():
@@ -131,11 +259,11 @@ def main():
         
         # Get resources
         print("\n2. Resources in state:")
-        resources = state_manager.get_resources()
-        if resources:
-            for resource in resources:
-                print(f"   {resource['type']}.{resource['name']}")
-        else:
+        found = False
+        for resource in state_manager.get_resources():
+            found = True
+            print(f"   {resource.type}.{resource.name}")
+        if not found:
             print("   No resources found")
         
         # Get outputs
@@ -0,0 +1,317 @@
+"""
+Tests for aws_infrastructure.AWSInfrastructureManager using botocore's Stubber
+"""
+
+from datetime import datetime, timezone
+
+import pytest
+from botocore.exceptions import ClientError, EndpointConnectionError
+from botocore.stub import Stubber
+
+import aws_infrastructure
+from aws_infrastructure import AWSInfrastructureManager, CloudFormationStack, EC2Instance, S3Bucket, VPC, _paginate
+
+LAUNCH_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def manager():
+    return AWSInfrastructureManager(region='us-east-1')
+
+
+def instance(instance_id):
+    return {
+        'InstanceId': instance_id,
+        'InstanceType': 't3.micro',
+        'State': {'Name': 'running'},
+        'PrivateIpAddress': '10.0.0.1',
+        'LaunchTime': LAUNCH_TIME,
+        'Tags': [{'Key': 'Name', 'Value': instance_id}]
+    }
+
+
+def vpc(vpc_id):
+    return {'VpcId': vpc_id, 'CidrBlock': '10.0.0.0/16', 'State': 'available', 'IsDefault': False}
+
+
+def test_paginate_follows_next_token():
+    calls = []
+    pages = [{'Items': [1], 'NextToken': 'a'}, {'Items': [2], 'NextToken': 'b'}, {'Items': [3]}]
+
+    def fake_call(**kwargs):
+        calls.append(kwargs)
+        return pages[len(calls) - 1]
+
+    assert [p['Items'] for p in _paginate(fake_call, Filter='x')] == [[1], [2], [3]]
+    assert calls == [
+        {'Filter': 'x', 'MaxResults': 1000},
+        {'Filter': 'x', 'MaxResults': 1000, 'NextToken': 'a'},
+        {'Filter': 'x', 'MaxResults': 1000, 'NextToken': 'b'}
+    ]
+
+
+@pytest.mark.parametrize('token', ['', None])
+def test_paginate_stops_on_empty_token(token):
+    calls = []
+
+    def fake_call(**kwargs):
+        calls.append(kwargs)
+        return {'Items': [], 'NextToken': token}
+
+    assert len(list(_paginate(fake_call, max_results=None))) == 1
+    assert calls == [{}]
+
+
+def test_list_ec2_instances_reads_every_page(manager):
+    with Stubber(manager.ec2) as stubber:
+        stubber.add_response(
+            'describe_instances',
+            {'Reservations': [{'Instances': [instance('i-1')]}], 'NextToken': 'page-2'},
+            {'MaxResults': 1000}
+        )
+        stubber.add_response(
+            'describe_instances',
+            {'Reservations': [{'Instances': [instance('i-2')]}]},
+            {'MaxResults': 1000, 'NextToken': 'page-2'}
+        )
+
+        instances = manager.list_ec2_instances()
+        stubber.assert_no_pending_responses()
+
+    assert [i.instance_id for i in instances] == ['i-1', 'i-2']
+    assert instances[0] == EC2Instance(
+        instance_id='i-1',
+        instance_type='t3.micro',
+        state='running',
+        public_ip='N/A',
+        private_ip='10.0.0.1',
+        launch_time=LAUNCH_TIME,
+        tags={'Name': 'i-1'}
+    )
+
+
+def test_get_vpc_info_reads_every_page(manager):
+    with Stubber(manager.ec2) as stubber:
+        stubber.add_response('describe_vpcs', {'Vpcs': [vpc('vpc-1')], 'NextToken': 'page-2'}, {'MaxResults': 1000})
+        stubber.add_response('describe_vpcs', {'Vpcs': [vpc('vpc-2')]}, {'MaxResults': 1000, 'NextToken': 'page-2'})
+
+        vpcs = manager.get_vpc_info()
+        stubber.assert_no_pending_responses()
+
+    assert [v.vpc_id for v in vpcs] == ['vpc-1', 'vpc-2']
+
+
+def test_list_cloudformation_stacks_reads_every_page(manager):
+    stack = {'StackName': 'a', 'StackStatus': 'CREATE_COMPLETE', 'CreationTime': LAUNCH_TIME}
+    statuses = ['CREATE_COMPLETE', 'UPDATE_COMPLETE']
+
+    with Stubber(manager.cloudformation) as stubber:
+        stubber.add_response('list_stacks', {'StackSummaries': [stack], 'NextToken': 'page-2'},
+                             {'StackStatusFilter': statuses})
+        stubber.add_response('list_stacks', {'StackSummaries': [dict(stack, StackName='b')]},
+                             {'StackStatusFilter': statuses, 'NextToken': 'page-2'})
+
+        stacks = manager.list_cloudformation_stacks()
+        stubber.assert_no_pending_responses()
+
+    assert [s.stack_name for s in stacks] == ['a', 'b']
+    assert stacks[0].creation_time == LAUNCH_TIME
+    assert stacks[0].description == 'N/A'
+
+
+def test_list_s3_buckets_looks_up_every_region(manager, monkeypatch):
+    # A single worker keeps the stubbed lookups in a deterministic order
+    monkeypatch.setattr(aws_infrastructure, 'S3_LOOKUP_WORKERS', 1)
+    buckets = {'Buckets': [{'Name': 'a', 'CreationDate': LAUNCH_TIME}, {'Name': 'b', 'CreationDate': LAUNCH_TIME}]}
+
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('list_buckets', buckets)
+        stubber.add_response('get_bucket_location', {'LocationConstraint': 'eu-west-1'}, {'Bucket': 'a'})
+        stubber.add_client_error('get_bucket_location', 'AccessDenied', expected_params={'Bucket': 'b'})
+
+        result = manager.list_s3_buckets()
+        stubber.assert_no_pending_responses()
+
+    assert {b.name: b.region for b in result} == {'a': 'eu-west-1', 'b': 'unknown'}
+    assert result[0].creation_date == LAUNCH_TIME
+
+
+def test_iter_vpcs_fetches_pages_lazily(manager, monkeypatch):
+    calls = []
+
+    def describe_vpcs(**kwargs):
+        calls.append(kwargs)
+        return {'Vpcs': [vpc('vpc-%d' % len(calls))], 'NextToken': 'more'}
+
+    monkeypatch.setattr(manager.ec2, 'describe_vpcs', describe_vpcs)
+
+    vpcs = manager.iter_vpcs()
+    assert next(vpcs).vpc_id == 'vpc-1'
+    assert len(calls) == 1
+    assert next(vpcs).vpc_id == 'vpc-2'
+    assert len(calls) == 2
+
+
+@pytest.mark.parametrize('client', ['ec2', 's3', 'iam', 'cloudformation', 'sts'])
+def test_clients_share_tuned_config(manager, client):
+    config = getattr(manager, client).meta.config
+    assert config.retries['mode'] == 'adaptive'
+    assert config.max_pool_connections == aws_infrastructure.S3_LOOKUP_WORKERS
+    assert config.tcp_keepalive is True
+
+
+def test_vpc_tags_become_a_dict(manager):
+    tags = [{'Key': 'Name', 'Value': 'main'}, {'Key': 'env', 'Value': 'dev'}]
+
+    with Stubber(manager.ec2) as stubber:
+        stubber.add_response('describe_vpcs', {'Vpcs': [dict(vpc('vpc-1'), Tags=tags)]}, {'MaxResults': 1000})
+
+        assert manager.get_vpc_info()[0].tags == {'Name': 'main', 'env': 'dev'}
+
+
+def test_list_ec2_instances_filters_server_side(manager):
+    vpc_filter = {'Name': 'vpc-id', 'Values': ['vpc-1']}
+    expected = {'MaxResults': 1000, 'Filters': [vpc_filter, {'Name': 'instance-state-name', 'Values': ['running']}]}
+
+    with Stubber(manager.ec2) as stubber:
+        stubber.add_response('describe_instances', {'Reservations': []}, expected)
+
+        assert manager.list_ec2_instances(states=['running'], filters=[vpc_filter]) == []
+        stubber.assert_no_pending_responses()
+
+
+def test_list_cloudformation_stacks_passes_statuses(manager):
+    with Stubber(manager.cloudformation) as stubber:
+        stubber.add_response('list_stacks', {'StackSummaries': []}, {'StackStatusFilter': ['ROLLBACK_COMPLETE']})
+
+        assert manager.list_cloudformation_stacks(statuses=['ROLLBACK_COMPLETE']) == []
+        stubber.assert_no_pending_responses()
+
+
+class RegionEchoManager(AWSInfrastructureManager):
+    """Subclass whose workers must be built from the subclass, not the base class"""
+
+    def get_vpc_info(self):
+        return self.region
+
+
+def test_scan_all_regions_uses_the_calling_class():
+    assert RegionEchoManager.scan_all_regions(['us-east-1', 'eu-west-1'], 'get_vpc_info') == {
+        'us-east-1': 'us-east-1', 'eu-west-1': 'eu-west-1'
+    }
+    assert RegionEchoManager.scan_all_regions([]) == {}
+
+
+def test_scan_all_regions_rejects_generators():
+    with pytest.raises(ValueError):
+        AWSInfrastructureManager.scan_all_regions(['us-east-1'], 'iter_vpcs')
+    with pytest.raises(ValueError):
+        AWSInfrastructureManager.scan_all_regions(['us-east-1'], 'no_such_method')
+
+
+def test_bucket_regions_are_cached(manager, monkeypatch):
+    monkeypatch.setattr(aws_infrastructure, 'S3_LOOKUP_WORKERS', 1)
+    buckets = {'Buckets': [{'Name': 'a', 'CreationDate': LAUNCH_TIME}, {'Name': 'b', 'CreationDate': LAUNCH_TIME}]}
+
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('list_buckets', buckets)
+        stubber.add_response('get_bucket_location', {'LocationConstraint': 'eu-west-1'}, {'Bucket': 'a'})
+        # us-east-1 buckets come back without a LocationConstraint
+        stubber.add_response('get_bucket_location', {}, {'Bucket': 'b'})
+        first = manager.list_s3_buckets()
+
+        # Second listing is answered from the region cache
+        stubber.add_response('list_buckets', buckets)
+        second = manager.list_s3_buckets()
+        stubber.assert_no_pending_responses()
+
+    assert {b.name: b.region for b in first} == {'a': 'eu-west-1', 'b': 'us-east-1'}
+    assert second == first
+
+
+def test_bucket_region_lookup_failure_is_unknown_and_not_cached(manager, monkeypatch):
+    def unreachable(**kwargs):
+        raise EndpointConnectionError(endpoint_url='https://s3.amazonaws.com')
+
+    monkeypatch.setattr(manager.s3, 'get_bucket_location', unreachable)
+
+    assert manager._get_bucket_region('a') == 'unknown'
+    assert manager._bucket_region_cache == {}
+
+
+def test_list_s3_buckets_without_regions(manager):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('list_buckets', {'Buckets': [{'Name': 'a', 'CreationDate': LAUNCH_TIME}]})
+
+        buckets = manager.list_s3_buckets(include_region=False)
+        stubber.assert_no_pending_responses()
+
+    assert buckets[0].region is None
+
+
+def test_upload_missing_file_returns_false(manager, tmp_path):
+    assert manager.upload_file_to_s3(str(tmp_path / 'missing.txt'), 'bucket', 'key') is False
+
+
+def test_unexpected_errors_propagate(manager, monkeypatch):
+    def broken(**kwargs):
+        raise KeyError('Vpcs')
+
+    monkeypatch.setattr(manager.ec2, 'describe_vpcs', broken)
+
+    with pytest.raises(KeyError):
+        manager.get_vpc_info()
+
+
+def test_account_info_is_cached_only_on_success(manager):
+    identity = {'Account': '123456789012', 'UserId': 'AIDA', 'Arn': 'arn:aws:iam::123456789012:user/dev'}
+
+    with Stubber(manager.sts) as stubber:
+        stubber.add_client_error('get_caller_identity', 'ExpiredToken')
+        assert manager.get_account_info() == {}
+
+        stubber.add_response('get_caller_identity', identity)
+        account_info = manager.get_account_info()
+        account_info['account_id'] = 'changed'
+
+        assert manager.get_account_info()['account_id'] == '123456789012'
+        stubber.assert_no_pending_responses()
+
+
+def test_invalidate_account_info_refetches(manager):
+    identity = {'Account': '123456789012', 'UserId': 'AIDA', 'Arn': 'arn:aws:iam::123456789012:user/dev'}
+
+    with Stubber(manager.sts) as stubber:
+        stubber.add_response('get_caller_identity', identity)
+        manager.get_account_info()
+
+        manager.invalidate_account_info()
+        stubber.add_response('get_caller_identity', dict(identity, Account='210987654321'))
+        assert manager.get_account_info()['account_id'] == '210987654321'
+        stubber.assert_no_pending_responses()
+
+
+def test_error_on_later_page_returns_empty_list(manager):
+    with Stubber(manager.ec2) as stubber:
+        stubber.add_response('describe_vpcs', {'Vpcs': [vpc('vpc-1')], 'NextToken': 'page-2'}, {'MaxResults': 1000})
+        stubber.add_client_error('describe_vpcs', 'UnauthorizedOperation')
+
+        assert manager.get_vpc_info() == []
+
+
+def test_iter_vpcs_raises_on_error(manager):
+    with Stubber(manager.ec2) as stubber:
+        stubber.add_response('describe_vpcs', {'Vpcs': [vpc('vpc-1')], 'NextToken': 'page-2'}, {'MaxResults': 1000})
+        stubber.add_client_error('describe_vpcs', 'UnauthorizedOperation')
+
+        vpcs = manager.iter_vpcs()
+        assert next(vpcs) == VPC(vpc_id='vpc-1', cidr_block='10.0.0.0/16', state='available',
+                                 is_default=False, tags={})
+        with pytest.raises(ClientError, match='UnauthorizedOperation'):
+            next(vpcs)
+
+
+@pytest.mark.parametrize('record_type', [EC2Instance, S3Bucket, CloudFormationStack, VPC])
+def test_records_are_unhashable(record_type):
+    # Records hold dicts, so they are compared by value but never hashed
+    assert record_type.__hash__ is None
@@ -0,0 +1,288 @@
+"""
+Tests for terraform_state.TerraformStateManager using botocore's Stubber
+"""
+
+import io
+import json
+
+import ijson
+import orjson
+import pytest
+from botocore.response import StreamingBody
+from botocore.stub import Stubber
+
+import terraform_state
+from terraform_state import TerraformResource, TerraformStateManager
+
+BUCKET = 'state-bucket'
+KEY = 'dev/terraform.tfstate'
+
+STATE = {
+    'version': 4,
+    'resources': [
+        {
+            'type': 'aws_vpc',
+            'name': 'main',
+            'provider': 'provider["registry.terraform.io/hashicorp/aws"]',
+            'instances': [{'attributes': {'cidr_block': '10.0.0.0/16'}}]
+        },
+        {
+            'type': 'aws_s3_bucket',
+            'name': 'logs',
+            'provider': 'provider["registry.terraform.io/hashicorp/aws"]',
+            'depends_on': ['aws_vpc.main'],
+            'instances': [{'attributes': {}}]
+        }
+    ],
+    'outputs': {'vpc_id': {'value': 'vpc-123'}}
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable replacement for time.monotonic() in terraform_state"""
+    now = [1000.0]
+    monkeypatch.setattr(terraform_state.time, 'monotonic', lambda: now[0])
+    return now
+
+
+@pytest.fixture
+def manager():
+    return TerraformStateManager(BUCKET, KEY, cache_ttl=300)
+
+
+def get_object_response(state, etag='"etag-1"'):
+    raw = json.dumps(state).encode()
+    return {'Body': StreamingBody(io.BytesIO(raw), len(raw)), 'ETag': etag}
+
+
+def get_object_params(etag=None):
+    params = {'Bucket': BUCKET, 'Key': KEY}
+    if etag:
+        params['IfNoneMatch'] = etag
+    return params
+
+
+def test_get_resources_flattens_instances(manager):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+
+        resources = list(manager.get_resources())
+
+    assert resources[0] == TerraformResource(
+        type='aws_vpc',
+        name='main',
+        provider='provider["registry.terraform.io/hashicorp/aws"]',
+        state={'cidr_block': '10.0.0.0/16'},
+        dependencies=[]
+    )
+    assert len(resources) == 2
+
+
+def test_queries_share_one_download(manager, clock):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+
+        assert [r.name for r in manager.get_resource_by_type('aws_vpc')] == ['main']
+        assert manager.get_resource_by_name('logs').dependencies == ['aws_vpc.main']
+        assert manager.list_outputs() == {'vpc_id': {'value': 'vpc-123'}}
+        stubber.assert_no_pending_responses()
+
+
+def test_download_state_reads_body(manager):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+
+        assert manager.download_state() == STATE
+
+
+def test_missing_state_yields_nothing(manager):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_client_error('get_object', 'NoSuchKey', expected_params=get_object_params())
+
+        assert list(manager.get_resources()) == []
+
+
+def test_cache_is_reused_within_ttl(manager, clock):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+        manager.download_state()
+
+        clock[0] += 299
+        assert manager.list_outputs() == {'vpc_id': {'value': 'vpc-123'}}
+        assert [r.name for r in manager.get_resources()] == ['main', 'logs']
+        stubber.assert_no_pending_responses()
+
+
+def test_callers_cannot_modify_the_cache(manager, clock):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+
+        manager.download_state()['outputs'].clear()
+        manager.list_outputs()['vpc_id']['value'] = 'changed'
+        next(manager.get_resources()).state['cidr_block'] = 'changed'
+
+        assert manager.download_state() == STATE
+        assert next(manager.get_resources()).state == {'cidr_block': '10.0.0.0/16'}
+        stubber.assert_no_pending_responses()
+
+
+def test_not_modified_returns_cached_copy_and_restarts_ttl(manager, clock):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+        first = manager.download_state()
+
+        clock[0] += 301
+        stubber.add_client_error(
+            'get_object', service_error_code='304', http_status_code=304,
+            expected_params=get_object_params('"etag-1"')
+        )
+        assert manager.download_state() == first
+
+        # The 304 restarted the TTL, so no further request is made
+        clock[0] += 299
+        assert manager.download_state() == first
+        stubber.assert_no_pending_responses()
+
+
+def test_changed_etag_reparses_state(manager, clock):
+    changed = dict(STATE, outputs={'vpc_id': {'value': 'vpc-456'}})
+
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+        manager.download_state()
+
+        clock[0] += 301
+        stubber.add_response(
+            'get_object', get_object_response(changed, etag='"etag-2"'),
+            get_object_params('"etag-1"')
+        )
+        assert manager.list_outputs() == {'vpc_id': {'value': 'vpc-456'}}
+
+        # The new ETag is used for the next revalidation
+        clock[0] += 301
+        stubber.add_client_error(
+            'get_object', service_error_code='304', http_status_code=304,
+            expected_params=get_object_params('"etag-2"')
+        )
+        assert manager.list_outputs() == {'vpc_id': {'value': 'vpc-456'}}
+        stubber.assert_no_pending_responses()
+
+
+def test_upload_state_clears_cache_and_etag(manager, clock):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+        manager.download_state()
+
+        body = orjson.dumps(STATE, option=orjson.OPT_INDENT_2)
+        stubber.add_response('put_object', {'ETag': '"etag-2"'}, {'Bucket': BUCKET, 'Key': KEY, 'Body': body})
+        assert manager.upload_state(STATE) is True
+
+        # Unconditional GET even though the TTL has not expired
+        stubber.add_response('get_object', get_object_response(STATE, etag='"etag-2"'), get_object_params())
+        assert manager.download_state() == STATE
+        stubber.assert_no_pending_responses()
+
+
+def test_malformed_state_returns_none(manager, clock):
+    raw = b'{"resources": ['
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(raw), len(raw))}, get_object_params())
+
+        assert manager.download_state() is None
+
+
+def test_every_instance_gets_resource_fields(manager, clock):
+    counted = {
+        'resources': [{
+            'type': 'aws_instance',
+            'name': 'web',
+            'provider': 'provider["registry.terraform.io/hashicorp/aws"]',
+            'depends_on': ['aws_vpc.main'],
+            'instances': [{'attributes': {'id': 'i-1'}}, {'attributes': {'id': 'i-2'}}]
+        }]
+    }
+
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', get_object_response(counted), get_object_params())
+
+        resources = list(manager.get_resources())
+
+    assert [r.state['id'] for r in resources] == ['i-1', 'i-2']
+    assert all(r.type == 'aws_instance' and r.dependencies == ['aws_vpc.main'] for r in resources)
+
+
+def test_stream_fetches_on_every_call(manager, clock):
+    with Stubber(manager.s3) as stubber:
+        for _ in range(2):
+            stubber.add_response('get_object', get_object_response(STATE), get_object_params())
+
+        assert manager.get_resource_by_name('main', stream=True).type == 'aws_vpc'
+        assert [r.name for r in manager.get_resource_by_type('aws_s3_bucket', stream=True)] == ['logs']
+        stubber.assert_no_pending_responses()
+
+    assert manager._cache is None
+
+
+def truncated_response():
+    # Cut off part way through the second resource
+    raw = json.dumps(STATE).encode()
+    raw = raw[:raw.index(b'"aws_s3_bucket"')]
+    return {'Body': StreamingBody(io.BytesIO(raw), len(raw))}
+
+
+def test_stream_raises_on_truncated_state(manager):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', truncated_response(), get_object_params())
+
+        resources = manager.get_resources(stream=True)
+        assert next(resources).name == 'main'
+        with pytest.raises(ijson.JSONError):
+            next(resources)
+
+
+def test_stream_queries_handle_errors(manager):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', truncated_response(), get_object_params())
+        stubber.add_client_error('get_object', 'NoSuchKey', expected_params=get_object_params())
+
+        assert manager.get_resource_by_type('aws_s3_bucket', stream=True) == []
+        assert manager.get_resource_by_name('main', stream=True) is None
+        stubber.assert_no_pending_responses()
+
+
+def test_stream_match_closes_body(manager):
+    raw = io.BytesIO(json.dumps(STATE).encode())
+
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', {'Body': StreamingBody(raw, len(raw.getvalue()))}, get_object_params())
+
+        assert manager.get_resource_by_name('main', stream=True).type == 'aws_vpc'
+
+    assert raw.closed
+
+
+@pytest.mark.parametrize('raw, expected', [
+    (b'{"serial": 123456789012345678901234567890}', {'serial': 123456789012345678901234567890}),
+    (b'{"serial": -9223372036854775809}', {'serial': -9223372036854775809}),
+    (b'{"serial": 1, "ratio": NaN}', {'serial': 1, 'ratio': float('nan')})
+])
+def test_download_falls_back_to_json(manager, clock, raw, expected):
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('get_object', {'Body': StreamingBody(io.BytesIO(raw), len(raw))}, get_object_params())
+
+        state = manager.download_state()
+
+    assert state['serial'] == expected['serial'] and isinstance(state['serial'], int)
+    assert repr(state) == repr(expected)
+
+
+def test_upload_falls_back_to_json_for_big_integers(manager):
+    state = {'serial': 2 ** 70}
+    body = json.dumps(state, indent=2).encode('utf-8')
+
+    with Stubber(manager.s3) as stubber:
+        stubber.add_response('put_object', {}, {'Bucket': BUCKET, 'Key': KEY, 'Body': body})
+
+        assert manager.upload_state(state) is True
+        stubber.assert_no_pending_responses()